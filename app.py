@@ -1,23 +1,44 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, create_refresh_token, get_jwt_identity
 from flask_restx import Api, Resource, fields
-import os
 from config import config
 from dotenv import load_dotenv
 from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
+from azure.storage.blob import BlobServiceClient
+from etl import PATIENT_CSV_DTYPES, validate_patient_df
+import orjson
 import pandas as pd
-import tensorflow as tf
-from pyspark.sql import SparkSession
+import requests
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+import base64
+import hashlib
+import io
 import logging
+import threading
 from datetime import datetime, timedelta
-from marshmallow import Schema, fields as marshmallow_fields, validate
-import uuid
+
+# Serialize numpy values and naive (UTC) datetimes natively in orjson
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config.from_object(config['default'])
 config['default'].init_app(app)
 
@@ -29,6 +50,13 @@ jwt = JWTManager(app)
 api = Api(app, version='1.0', title='Healthcare Analytics API',
           description='API for healthcare data analytics and anomaly detection')
 
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """Serialize API responses with orjson"""
+    resp = make_response(orjson.dumps(data, option=ORJSON_OPTIONS), code)
+    resp.headers.extend(headers or {})
+    return resp
+
 # Configure logging
 logging.basicConfig(level=app.config['LOG_LEVEL'])
 logger = logging.getLogger(__name__)
@@ -36,19 +64,64 @@ logger = logging.getLogger(__name__)
 # Initialize Azure services
 credential = DefaultAzureCredential()
 secret_client = SecretClient(vault_url=app.config['AZURE_KEY_VAULT_URI'], credential=credential)
-cosmos_client = CosmosClient(app.config['AZURE_COSMOS_ENDPOINT'], credential=app.config['AZURE_COSMOS_KEY'])
-database = cosmos_client.get_database_client("HealthcareDB")
-container = database.get_container_client("PatientData")
 
-# Initialize Spark
-spark = SparkSession.builder.appName("HealthcareETL").getOrCreate()
+# Share one bounded keep-alive pool across all Cosmos DB requests from this process
+cosmos_session = requests.Session()
+
+def reset_cosmos_pool():
+    """Give this process a fresh Cosmos DB connection pool (called again in each forked worker)"""
+    # The previous adapter is dropped rather than closed, since its sockets may still be in use by the parent
+    cosmos_session.mount('https://', HTTPAdapter(
+        pool_connections=app.config['COSMOS_POOL_MAXSIZE'],
+        pool_maxsize=app.config['COSMOS_POOL_MAXSIZE']
+    ))
+
+reset_cosmos_pool()
+cosmos_client = CosmosClient(
+    app.config['AZURE_COSMOS_ENDPOINT'],
+    credential=app.config['AZURE_COSMOS_KEY'],
+    connection_timeout=app.config['COSMOS_CONNECT_TIMEOUT'],
+    transport=RequestsTransport(
+        session=cosmos_session,
+        session_owner=False,
+        read_timeout=app.config['COSMOS_READ_TIMEOUT']
+    )
+)
+database = cosmos_client.get_database_client(app.config['COSMOS_DATABASE'])
+container = database.get_container_client(app.config['COSMOS_CONTAINER'])
+status_container = database.get_container_client(app.config['COSMOS_STATUS_CONTAINER'])
 
-# Schema definitions for request validation
-class PatientDataSchema(Schema):
-    patient_id = marshmallow_fields.String(required=True)
-    age = marshmallow_fields.Integer(validate=validate.Range(min=0, max=120))
-    disease = marshmallow_fields.String(required=True)
-    timestamp = marshmallow_fields.DateTime(required=True)
+# Raw uploads are staged in Blob Storage and processed by the ETL function (function_app.py)
+blob_service = BlobServiceClient(account_url=app.config['AZURE_STORAGE_ACCOUNT_URL'], credential=credential)
+upload_container = blob_service.get_container_client(app.config['UPLOAD_BLOB_CONTAINER'])
+
+# Short-lived cache for expensive cross-partition aggregation queries
+query_cache = TTLCache(maxsize=32, ttl=app.config['DASHBOARD_CACHE_TTL'])
+query_cache_lock = threading.Lock()
+query_locks = {}  # one lock per query text; queries are fixed strings, so this stays small
+
+def query_aggregate(query):
+    """Run an aggregation query, caching the result per query text"""
+    with query_cache_lock:
+        items = query_cache.get(query)
+        if items is not None:
+            return items
+        query_lock = query_locks.setdefault(query, threading.Lock())
+
+    # Only one request per query refreshes an expired entry; the rest wait for its result
+    with query_lock:
+        with query_cache_lock:
+            items = query_cache.get(query)
+        if items is None:
+            items = list(container.query_items(
+                query,
+                enable_cross_partition_query=True,
+                max_item_count=-1,
+                populate_query_metrics=False
+            ))
+            with query_cache_lock:
+                query_cache[query] = items
+        return items
 
 # API Models for Swagger documentation
 patient_model = api.model('Patient', {
@@ -58,19 +131,19 @@ patient_model = api.model('Patient', {
     'timestamp': fields.DateTime(required=True, description='Record timestamp')
 })
 
-# Sample TensorFlow model for anomaly detection
-def load_anomaly_model():
-    model = tf.keras.Sequential([
-        tf.keras.layers.Dense(64, activation="relu", input_shape=(10,)),
-        tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.Dense(32, activation="relu"),
-        tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.Dense(1, activation="sigmoid")
-    ])
-    model.compile(optimizer="adam", loss="binary_crossentropy", metrics=['accuracy'])
-    return model
+# Maximum number of anomalous records returned per page
+ANOMALY_PAGE_SIZE = 1000
+
+def encode_cursor(item):
+    """Encode the (timestamp, id) of the last record on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps([item['timestamp'], item['id']])).decode()
 
-anomaly_model = load_anomaly_model()
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, raising ValueError if it is malformed"""
+    key = orjson.loads(base64.urlsafe_b64decode(cursor))
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+        raise ValueError('Malformed cursor')
+    return key
 
 @api.route('/health')
 class HealthCheck(Resource):
@@ -104,7 +177,7 @@ class DataUpload(Resource):
     }))
     @jwt_required()
     def post(self):
-        """Upload and process healthcare data"""
+        """Upload healthcare data for asynchronous processing"""
         try:
             if 'file' not in request.files:
                 return {'error': 'No file provided'}, 400
@@ -113,37 +186,71 @@ class DataUpload(Resource):
             if not file.filename.endswith('.csv'):
                 return {'error': 'Only CSV files are supported'}, 400
             
-            # Save file temporarily
-            filename = f"{uuid.uuid4()}.csv"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Read and validate data
-            df = pd.read_csv(filepath)
-            schema = PatientDataSchema(many=True)
+            # Validate up front so bad files are rejected before they are queued
+            data = file.read()
+            df = pd.read_csv(io.BytesIO(data), dtype=PATIENT_CSV_DTYPES)
             try:
-                validated_data = schema.load(df.to_dict('records'))
-            except Exception as e:
+                validate_patient_df(df)
+            except ValueError as e:
                 return {'error': f'Data validation failed: {str(e)}'}, 400
             
-            # Process with Spark
-            spark_df = spark.createDataFrame(df)
-            spark_df = spark_df.dropna()
-            
-            # Store in Cosmos DB
-            for row in spark_df.toPandas().to_dict('records'):
-                container.upsert_item(row)
+            # Identical files hash to the same upload, so re-uploads are deduplicated
+            upload_id = hashlib.blake2b(data, digest_size=16).hexdigest()
+            # Shard blob names by hash prefix to keep any one virtual directory small
+            blob_name = f"{upload_id[:2]}/{upload_id[2:4]}/{upload_id}.csv"
+            status = {
+                'id': upload_id,
+                'status': 'pending',
+                'filename': file.filename,
+                'records': len(df),
+                'created_at': datetime.utcnow().isoformat()
+            }
+            # The status document goes first so the ETL function always finds it
+            try:
+                status_container.create_item(status)
+            except CosmosResourceExistsError:
+                existing = status_container.read_item(item=upload_id, partition_key=upload_id)
+                # A pending upload whose blob write failed would otherwise never be processed
+                stuck = existing['status'] == 'pending' and not upload_container.get_blob_client(blob_name).exists()
+                if existing['status'] != 'failed' and not stuck:
+                    return {
+                        'message': 'Identical file already uploaded',
+                        'upload_id': upload_id,
+                        'status': existing['status']
+                    }, 200
+                # Re-queue failed or stuck uploads when the same file is sent again
+                status_container.upsert_item(status)
             
-            # Clean up
-            os.remove(filepath)
+            upload_container.upload_blob(blob_name, data, overwrite=True)
             
-            logger.info(f"Successfully processed file: {file.filename}")
-            return {'message': 'Data uploaded successfully', 'records': len(df)}, 200
+            logger.info(f"Queued file {file.filename} for processing as upload {upload_id}")
+            return {
+                'message': 'Data accepted for processing',
+                'upload_id': upload_id,
+                'records': len(df)
+            }, 202
         
         except Exception as e:
             logger.error(f"Error uploading data: {str(e)}")
             return {'error': str(e)}, 500
 
+@api.route('/data/status/<string:upload_id>')
+class UploadStatus(Resource):
+    @api.doc('get_upload_status', security='Bearer')
+    @jwt_required()
+    def get(self, upload_id):
+        """Get the processing status of an upload"""
+        try:
+            item = status_container.read_item(item=upload_id, partition_key=upload_id)
+        except CosmosResourceNotFoundError:
+            return {'error': 'Upload not found'}, 404
+        except Exception as e:
+            logger.error(f"Error fetching upload status: {str(e)}")
+            return {'error': str(e)}, 500
+        
+        # Strip Cosmos DB system properties (_rid, _etag, ...)
+        return {key: value for key, value in item.items() if not key.startswith('_')}, 200
+
 @api.route('/dashboard')
 class Dashboard(Resource):
     @api.doc('get_dashboard', security='Bearer')
@@ -152,7 +259,7 @@ class Dashboard(Resource):
         """Get healthcare dashboard trends"""
         try:
             query = "SELECT c.disease, COUNT(c.id) as count FROM c GROUP BY c.disease"
-            items = list(container.query_items(query, enable_cross_partition_query=True))
+            items = query_aggregate(query)
             return {'trends': items}, 200
         except Exception as e:
             logger.error(f"Error fetching dashboard trends: {str(e)}")
@@ -160,27 +267,43 @@ class Dashboard(Resource):
 
 @api.route('/analytics/anomalies')
 class Anomalies(Resource):
-    @api.doc('get_anomalies', security='Bearer')
+    @api.doc('get_anomalies', security='Bearer',
+             params={'continuation': 'Continuation token from a previous page'})
     @jwt_required()
     def get(self):
-        """Detect anomalies in recent healthcare data"""
+        """List anomalies flagged in recent healthcare data, one page at a time"""
+        parameters = [
+            {"name": "@limit", "value": ANOMALY_PAGE_SIZE},
+            {"name": "@recent", "value": (datetime.utcnow() - timedelta(days=7)).isoformat()}
+        ]
+        # Keyset paging: resume strictly after the last (timestamp, id) of the previous
+        # page, since Cosmos continuation tokens don't survive cross-partition ORDER BY
+        after_cursor = ""
+        cursor = request.args.get('continuation')
+        if cursor:
+            try:
+                before, before_id = decode_cursor(cursor)
+            except ValueError:
+                return {'error': 'Invalid continuation token'}, 400
+            parameters += [{"name": "@before", "value": before}, {"name": "@before_id", "value": before_id}]
+            after_cursor = " AND (c.timestamp < @before OR (c.timestamp = @before AND c.id < @before_id))"
+
         try:
-            query = "SELECT * FROM c WHERE c.timestamp > @recent ORDER BY c.timestamp DESC"
-            items = list(container.query_items(
+            # Project only the fields clients need and fetch a single page per request
+            query = (
+                "SELECT TOP @limit c.id, c.patient_id, c.age, c.disease, c.timestamp FROM c "
+                f"WHERE c.is_anomaly = true AND c.timestamp > @recent{after_cursor} "
+                "ORDER BY c.timestamp DESC, c.id DESC"
+            )
+            anomalies = list(container.query_items(
                 query=query,
-                parameters=[{"name": "@recent", "value": (datetime.utcnow() - timedelta(days=7)).isoformat()}],
+                parameters=parameters,
                 enable_cross_partition_query=True
             ))
             
-            df = pd.DataFrame(items)
-            if not df.empty:
-                features = df.select_dtypes(include=['float64', 'int64']).values
-                predictions = anomaly_model.predict(features)
-                anomalies = df[predictions > 0.5].to_dict('records')
-            else:
-                anomalies = []
-            
-            return {'anomalies': anomalies}, 200
+            # A short page means there is nothing left to fetch
+            next_cursor = encode_cursor(anomalies[-1]) if len(anomalies) == ANOMALY_PAGE_SIZE else None
+            return {'anomalies': anomalies, 'continuation': next_cursor}, 200
         
         except Exception as e:
             logger.error(f"Error detecting anomalies: {str(e)}")
@@ -5,6 +5,14 @@ from datetime import timedelta
 # Load environment variables
 load_dotenv()
 
+# Pin native thread pools before numpy or TensorFlow are imported, so that
+# several Functions worker processes scoring uploads on one instance
+# (FUNCTIONS_WORKER_PROCESS_COUNT) don't each spawn one thread per core
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', '2'))
+for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+    os.environ.setdefault(var, str(INFERENCE_THREADS))
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
 class Config:
     # Flask settings
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key')
@@ -19,11 +27,22 @@ class Config:
     AZURE_COSMOS_ENDPOINT = os.getenv('AZURE_COSMOS_ENDPOINT')
     AZURE_COSMOS_KEY = os.getenv('AZURE_COSMOS_KEY')
     AZURE_KEY_VAULT_URI = os.getenv('AZURE_KEY_VAULT_URI')
+    COSMOS_DATABASE = 'HealthcareDB'
+    COSMOS_CONTAINER = 'PatientData'
+    COSMOS_STATUS_CONTAINER = 'UploadStatus'
+    COSMOS_UPSERT_CONCURRENCY = int(os.getenv('COSMOS_UPSERT_CONCURRENCY', '64'))
+    COSMOS_CONNECT_TIMEOUT = int(os.getenv('COSMOS_CONNECT_TIMEOUT', '5'))  # seconds
+    COSMOS_READ_TIMEOUT = int(os.getenv('COSMOS_READ_TIMEOUT', '30'))  # seconds
+    COSMOS_POOL_MAXSIZE = int(os.getenv('COSMOS_POOL_MAXSIZE', '16'))
+    AZURE_STORAGE_ACCOUNT_URL = os.getenv('AZURE_STORAGE_ACCOUNT_URL')
+    UPLOAD_BLOB_CONTAINER = os.getenv('UPLOAD_BLOB_CONTAINER', 'uploads')
     
     # Application settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'csv'}
-    UPLOAD_FOLDER = 'uploads'
+    DISEASE_CODE_PATTERN = os.getenv('DISEASE_CODE_PATTERN')  # e.g. ICD-10: [A-TV-Z][0-9][0-9AB](\.[0-9A-TV-Z]{1,4})?
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '60'))  # seconds
+    INFERENCE_THREADS = INFERENCE_THREADS
     
     # Security settings
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
@@ -33,9 +52,8 @@ class Config:
     
     @staticmethod
     def init_app(app):
-        # Create upload folder if it doesn't exist
-        if not os.path.exists(Config.UPLOAD_FOLDER):
-            os.makedirs(Config.UPLOAD_FOLDER)
+        # Uploads are staged in Blob Storage, so there is no local state to set up
+        pass
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,180 @@
+from config import config
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+from azure.core.pipeline.transport import AioHttpTransport
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import asyncio
+from functools import lru_cache
+import io
+import tempfile
+import threading
+
+settings = config['default']
+
+# Optional controlled vocabulary for disease codes. Grouped so pandas' ^...$ anchoring
+# applies to every alternative, and checked against pyarrow's RE2 engine at startup
+# so an invalid (or backtracking-only) pattern fails fast instead of on first upload
+DISEASE_CODE_PATTERN = f"(?:{settings.DISEASE_CODE_PATTERN})" if settings.DISEASE_CODE_PATTERN else None
+if DISEASE_CODE_PATTERN:
+    pc.match_substring_regex(pa.array([''], pa.string()), DISEASE_CODE_PATTERN)
+
+# Patient record constraints, checked column-wise for a whole upload at once
+REQUIRED_PATIENT_COLUMNS = ['patient_id', 'disease', 'timestamp']
+PATIENT_COLUMNS = REQUIRED_PATIENT_COLUMNS + ['age']
+
+# Timestamps must carry a time of day, not just a date
+ISO_DATETIME_PATTERN = r'\d{4}-\d{1,2}-\d{1,2}[T ]\d{1,2}:\d{1,2}'
+
+def validate_patient_df(df):
+    """Validate uploaded patient records, raising ValueError on the first failed constraint"""
+    missing = [column for column in REQUIRED_PATIENT_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    unknown = [column for column in df.columns if column not in PATIENT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    for column in REQUIRED_PATIENT_COLUMNS:
+        if df[column].isna().any():
+            raise ValueError(f"Column '{column}' has missing values")
+    if 'age' in df.columns and not pd.to_numeric(df['age'], errors='coerce').between(0, 120).all():
+        raise ValueError("Column 'age' must be a number between 0 and 120")
+    # Arrow-backed strings match in a single RE2 pass instead of per-row Python re calls
+    if DISEASE_CODE_PATTERN and not df['disease'].astype('string[pyarrow]').str.fullmatch(DISEASE_CODE_PATTERN).all():
+        raise ValueError("Column 'disease' contains codes outside the allowed vocabulary")
+    try:
+        if not df['timestamp'].astype('string[pyarrow]').str.match(ISO_DATETIME_PATTERN).all():
+            raise ValueError
+        pd.to_datetime(df['timestamp'], format='ISO8601')
+    except (ValueError, TypeError):
+        raise ValueError("Column 'timestamp' must contain ISO 8601 datetimes")
+
+# Column types for uploaded patient CSVs; kept as strings so validation sees the raw values
+PATIENT_CSV_DTYPES = {
+    'patient_id': str,
+    'disease': str,
+    'timestamp': str
+}
+
+# Number of input features expected by the anomaly model
+N_FEATURES = 10
+
+# Model score above which a record is flagged as anomalous
+ANOMALY_THRESHOLD = 0.5
+
+# Sample TensorFlow model for anomaly detection
+def load_anomaly_model():
+    import tensorflow as tf
+    model = tf.keras.Sequential([
+        tf.keras.layers.Dense(64, activation="relu", input_shape=(N_FEATURES,)),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(32, activation="relu"),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(1, activation="sigmoid")
+    ])
+    model.compile(optimizer="adam", loss="binary_crossentropy", metrics=['accuracy'])
+    return model
+
+def _representative_features():
+    """Calibration batches for int8 quantization, shaped like real uploads across the range of patient ages"""
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        # Built the same way as at ingest: age in column 0, the remaining features zero-filled
+        yield [build_feature_matrix(pd.DataFrame({'age': rng.integers(0, 121, 1)}))]
+
+# TensorFlow is imported and the model converted on first use, so importing this
+# module stays cheap for processes that never score anything
+@lru_cache(maxsize=1)
+def get_anomaly_scorer():
+    """Quantize the anomaly model to int8 TFLite and return a thread-safe scoring function"""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(settings.INFERENCE_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    anomaly_model = load_anomaly_model()
+    serve = tf.function(
+        lambda x: anomaly_model(x, training=False),
+        input_signature=[tf.TensorSpec([None, N_FEATURES], tf.float32, name='x')]
+    )
+
+    # Export an inference-only SavedModel (no optimizer state or Dropout) and convert it
+    with tempfile.TemporaryDirectory() as export_dir:
+        tf.saved_model.save(anomaly_model, export_dir, signatures={'serving_default': serve})
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir, signature_keys=['serving_default'])
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = _representative_features
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        tflite_model = converter.convert()
+
+    interpreter = tf.lite.Interpreter(model_content=tflite_model, num_threads=settings.INFERENCE_THREADS)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+    lock = threading.Lock()
+
+    def score(x):
+        # The interpreter holds mutable buffers, so calls are serialized
+        with lock:
+            if tuple(interpreter.get_input_details()[0]['shape']) != x.shape:
+                interpreter.resize_tensor_input(input_index, x.shape)
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(input_index, x)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)
+
+    return score
+
+def score_features(features):
+    """Score a feature matrix, padding the batch to a power-of-two bucket to limit tensor reallocations"""
+    features = np.asarray(features, dtype=np.float32)
+    n_rows = features.shape[0]
+    bucket = 1 << max(n_rows - 1, 0).bit_length()
+    if bucket != n_rows:
+        padded = np.zeros((bucket, features.shape[1]), dtype=np.float32)
+        padded[:n_rows] = features
+        features = padded
+    return get_anomaly_scorer()(features).ravel()[:n_rows]
+
+def build_feature_matrix(df):
+    """Copy numeric columns into a float32 matrix sized for the model, zero-filling missing features"""
+    columns = df.select_dtypes(include=['float64', 'int64']).columns[:N_FEATURES]
+    features = np.zeros((len(df), N_FEATURES), dtype=np.float32)
+    for i, column in enumerate(columns):
+        features[:, i] = df[column].to_numpy(dtype=np.float32, copy=False)
+    return features
+
+async def bulk_upsert(rows):
+    """Upsert rows concurrently over a single async Cosmos DB client"""
+    semaphore = asyncio.Semaphore(settings.COSMOS_UPSERT_CONCURRENCY)
+    # The async client is bound to the running event loop, so it is opened per batch
+    async with AsyncCosmosClient(
+        settings.AZURE_COSMOS_ENDPOINT,
+        credential=settings.AZURE_COSMOS_KEY,
+        connection_timeout=settings.COSMOS_CONNECT_TIMEOUT,
+        transport=AioHttpTransport(read_timeout=settings.COSMOS_READ_TIMEOUT)
+    ) as client:
+        async_container = client.get_database_client(settings.COSMOS_DATABASE) \
+            .get_container_client(settings.COSMOS_CONTAINER)
+
+        async def upsert(row):
+            async with semaphore:
+                await async_container.upsert_item(row)
+
+        await asyncio.gather(*(upsert(row) for row in rows))
+
+def transform_upload(data, upload_id):
+    """Validate, clean and score a raw CSV upload, returning the records to store"""
+    df = pd.read_csv(io.BytesIO(data), dtype=PATIENT_CSV_DTYPES)
+    validate_patient_df(df)
+
+    # Drop incomplete and duplicate records
+    df = df.dropna().drop_duplicates()
+    if df.empty:
+        return []
+
+    # Score at ingest so the anomalies endpoint can filter server-side
+    df['is_anomaly'] = score_features(build_feature_matrix(df)) > ANOMALY_THRESHOLD
+    # Ids derive from the upload and row position, so a retried blob overwrites
+    # the records of the earlier attempt instead of duplicating them
+    df['id'] = upload_id + '-' + pd.RangeIndex(len(df)).astype(str)
+    return df.to_dict('records')
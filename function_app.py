@@ -0,0 +1,75 @@
+from config import config
+import azure.functions as func
+from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from etl import bulk_upsert, transform_upload
+import asyncio
+import logging
+import posixpath
+from datetime import datetime
+
+settings = config['default']
+
+# Azure Functions app running the upload ETL out of the request path
+app = func.FunctionApp()
+logger = logging.getLogger(__name__)
+
+cosmos_client = CosmosClient(settings.AZURE_COSMOS_ENDPOINT, credential=settings.AZURE_COSMOS_KEY)
+status_container = cosmos_client.get_database_client(settings.COSMOS_DATABASE) \
+    .get_container_client(settings.COSMOS_STATUS_CONTAINER)
+
+def update_status(upload_id, status, **details):
+    """Record the processing state of an upload for the /data/status endpoint"""
+    item = status_container.read_item(item=upload_id, partition_key=upload_id)
+    item.update(details, status=status, updated_at=datetime.utcnow().isoformat())
+    status_container.upsert_item(item)
+
+def upload_id_for(blob_name):
+    """Recover the upload id from a blob path such as ab/cd/<upload_id>.csv"""
+    return posixpath.splitext(posixpath.basename(blob_name))[0]
+
+@app.function_name('etl')
+@app.blob_trigger(arg_name='blob', path=f"{settings.UPLOAD_BLOB_CONTAINER}/{{name}}",
+                  connection='AzureWebJobsStorage')
+def etl(blob: func.InputStream):
+    """Validate, score and store a raw CSV upload once it lands in Blob Storage"""
+    upload_id = upload_id_for(blob.name)
+    try:
+        update_status(upload_id, 'processing')
+    except CosmosResourceNotFoundError:
+        # Blobs without a status document weren't accepted by the API; retrying won't change that
+        logger.warning(f"Skipping blob {blob.name}: no status document for upload {upload_id}")
+        return
+
+    try:
+        records = transform_upload(blob.read(), upload_id)
+        asyncio.run(bulk_upsert(records))
+    except ValueError as e:
+        # Invalid data won't get better on retry
+        logger.error(f"Upload {upload_id} failed validation: {str(e)}")
+        update_status(upload_id, 'failed', error=str(e))
+        return
+    except Exception as e:
+        # Re-raise so the Functions runtime retries the blob; etl_poison marks it failed
+        # once the retries are exhausted
+        logger.error(f"Error processing upload {upload_id}: {str(e)}")
+        update_status(upload_id, 'retrying', error=str(e))
+        raise
+
+    update_status(upload_id, 'completed', stored=len(records))
+    logger.info(f"Successfully processed upload {upload_id}")
+
+@app.function_name('etl_poison')
+@app.queue_trigger(arg_name='msg', queue_name='webjobs-blobtrigger-poison',
+                   connection='AzureWebJobsStorage')
+def etl_poison(msg: func.QueueMessage):
+    """Mark an upload failed once the runtime stops retrying its blob"""
+    poison = msg.get_json()
+    if poison.get('ContainerName') != settings.UPLOAD_BLOB_CONTAINER:
+        return
+    upload_id = upload_id_for(poison['BlobName'])
+    logger.error(f"Upload {upload_id} exhausted its retries")
+    try:
+        update_status(upload_id, 'failed', error='Processing failed after repeated retries')
+    except CosmosResourceNotFoundError:
+        logger.warning(f"No status document for poisoned upload {upload_id}")
@@ -0,0 +1,15 @@
+import multiprocessing
+
+# The API only does I/O-bound work (model scoring runs in the ETL function),
+# so use the usual 2 * cores + 1 workers
+bind = "0.0.0.0:8080"
+workers = multiprocessing.cpu_count() * 2 + 1
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+def post_fork(server, worker):
+    # The Cosmos DB client connects while the app is imported; sockets opened
+    # by the master must not be shared across workers
+    from app import reset_cosmos_pool
+    reset_cosmos_pool()
@@ -1,5 +1,10 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 import pytest
-from app import app
+from app import app, query_aggregate, query_cache
+from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
 from flask_jwt_extended import create_access_token
 
 @pytest.fixture
@@ -31,6 +36,25 @@ def test_protected_endpoint(client):
                          headers={'Authorization': f'Bearer {access_token}'})
     assert response.status_code == 200
 
+def test_dashboard_query_runs_once_while_cached():
+    query_cache.clear()
+    calls = []
+    
+    def slow_query(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.05)
+        return [{'disease': 'flu', 'count': 1}]
+    
+    # Concurrent misses on the same query share a single Cosmos DB round-trip
+    with mock.patch('app.container') as container:
+        container.query_items.side_effect = slow_query
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: query_aggregate('SELECT 1'), range(8)))
+    
+    assert len(calls) == 1
+    assert all(result == [{'disease': 'flu', 'count': 1}] for result in results)
+    query_cache.clear()
+
 def test_upload_endpoint(client):
     access_token = create_access_token(identity='test_user')
     
@@ -45,10 +69,123 @@ def test_upload_endpoint(client):
                           data={'file': (b'content', 'test.txt')})
     assert response.status_code == 400
 
+def test_upload_validation(client):
+    access_token = create_access_token(identity='test_user')
+    
+    # Test with an out-of-range age
+    csv = b'patient_id,age,disease,timestamp\np1,150,flu,2024-01-01T00:00:00\n'
+    response = client.post('/data/upload',
+                          headers={'Authorization': f'Bearer {access_token}'},
+                          data={'file': (io.BytesIO(csv), 'test.csv')})
+    assert response.status_code == 400
+    assert 'age' in response.json['error']
+    
+    # Test with a missing required column
+    csv = b'patient_id,age,timestamp\np1,40,2024-01-01T00:00:00\n'
+    response = client.post('/data/upload',
+                          headers={'Authorization': f'Bearer {access_token}'},
+                          data={'file': (io.BytesIO(csv), 'test.csv')})
+    assert response.status_code == 400
+    assert 'disease' in response.json['error']
+    
+    # Test with a column outside the patient schema
+    csv = b'patient_id,age,disease,timestamp,notes\np1,40,flu,2024-01-01T00:00:00,x\n'
+    response = client.post('/data/upload',
+                          headers={'Authorization': f'Bearer {access_token}'},
+                          data={'file': (io.BytesIO(csv), 'test.csv')})
+    assert response.status_code == 400
+    assert 'notes' in response.json['error']
+    
+    # Test with a date-only timestamp
+    csv = b'patient_id,age,disease,timestamp\np1,40,flu,2024-01-01\n'
+    response = client.post('/data/upload',
+                          headers={'Authorization': f'Bearer {access_token}'},
+                          data={'file': (io.BytesIO(csv), 'test.csv')})
+    assert response.status_code == 400
+    assert 'timestamp' in response.json['error']
+
+def upload_existing(client, existing_status, blob_exists):
+    # Send a valid file whose status document already exists
+    access_token = create_access_token(identity='test_user')
+    csv = b'patient_id,age,disease,timestamp\np1,40,flu,2024-01-01T00:00:00\n'
+    with mock.patch('app.status_container') as status_container, \
+            mock.patch('app.upload_container') as upload_container:
+        status_container.create_item.side_effect = CosmosResourceExistsError()
+        status_container.read_item.return_value = {'id': 'x', 'status': existing_status}
+        upload_container.get_blob_client.return_value.exists.return_value = blob_exists
+        response = client.post('/data/upload',
+                              headers={'Authorization': f'Bearer {access_token}'},
+                              data={'file': (io.BytesIO(csv), 'test.csv')})
+    return response, status_container, upload_container
+
+def test_upload_duplicate_is_deduplicated(client):
+    for existing_status in ['pending', 'processing', 'completed']:
+        response, status_container, upload_container = upload_existing(client, existing_status, blob_exists=True)
+        assert response.status_code == 200
+        assert response.json['status'] == existing_status
+        status_container.upsert_item.assert_not_called()
+        upload_container.upload_blob.assert_not_called()
+
+def test_upload_duplicate_is_requeued(client):
+    # Failed uploads, and pending ones whose blob was never written, are queued again
+    for existing_status, blob_exists in [('failed', True), ('pending', False)]:
+        response, status_container, upload_container = upload_existing(client, existing_status, blob_exists)
+        assert response.status_code == 202
+        assert status_container.upsert_item.call_args.args[0]['status'] == 'pending'
+        upload_container.upload_blob.assert_called_once()
+
+def test_upload_status_not_found(client):
+    access_token = create_access_token(identity='test_user')
+    
+    with mock.patch('app.status_container') as status_container:
+        status_container.read_item.side_effect = CosmosResourceNotFoundError()
+        response = client.get('/data/status/does-not-exist',
+                             headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == 404
+
 def test_anomalies_endpoint(client):
     access_token = create_access_token(identity='test_user')
     
     response = client.get('/analytics/anomalies',
                          headers={'Authorization': f'Bearer {access_token}'})
     assert response.status_code == 200
-    assert 'anomalies' in response.json 
\ No newline at end of file
+    assert 'anomalies' in response.json
+    assert 'continuation' in response.json
+
+def test_anomalies_second_page_continues_after_first(client):
+    access_token = create_access_token(identity='test_user')
+    headers = {'Authorization': f'Bearer {access_token}'}
+    first_page = [
+        {'id': 'b', 'patient_id': 'p1', 'age': 40, 'disease': 'flu', 'timestamp': '2024-01-02T00:00:00'},
+        {'id': 'a', 'patient_id': 'p2', 'age': 50, 'disease': 'flu', 'timestamp': '2024-01-01T00:00:00'}
+    ]
+    second_page = [
+        {'id': 'c', 'patient_id': 'p3', 'age': 60, 'disease': 'flu', 'timestamp': '2023-12-31T00:00:00'}
+    ]
+    
+    with mock.patch('app.ANOMALY_PAGE_SIZE', 2), mock.patch('app.container') as container:
+        container.query_items.side_effect = [iter(first_page), iter(second_page)]
+        response = client.get('/analytics/anomalies', headers=headers)
+        assert response.status_code == 200
+        assert response.json['anomalies'] == first_page
+        cursor = response.json['continuation']
+        assert cursor
+        
+        response = client.get(f'/analytics/anomalies?continuation={cursor}', headers=headers)
+        assert response.status_code == 200
+        assert response.json['anomalies'] == second_page
+        assert response.json['continuation'] is None
+    
+    # The second query resumes strictly after the last record of the first page
+    second_call = container.query_items.call_args_list[1].kwargs
+    assert 'c.timestamp < @before' in second_call['query']
+    parameters = {p['name']: p['value'] for p in second_call['parameters']}
+    assert parameters['@before'] == '2024-01-01T00:00:00'
+    assert parameters['@before_id'] == 'a'
+
+def test_anomalies_invalid_continuation(client):
+    access_token = create_access_token(identity='test_user')
+    
+    response = client.get('/analytics/anomalies?continuation=not-a-cursor',
+                         headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == 400
@@ -0,0 +1,50 @@
+import importlib.util
+from unittest import mock
+import pandas as pd
+import pyarrow as pa
+import pytest
+import etl
+
+def load_etl(monkeypatch, pattern):
+    # Execute a fresh copy of etl so its import-time pattern handling runs
+    # without replacing the module the app already holds
+    monkeypatch.setattr(etl.settings, 'DISEASE_CODE_PATTERN', pattern)
+    spec = importlib.util.spec_from_file_location('etl_under_test', etl.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def patient_df(disease):
+    return pd.DataFrame({
+        'patient_id': ['p1'],
+        'age': [40],
+        'disease': [disease],
+        'timestamp': ['2024-01-01T00:00:00']
+    })
+
+def test_disease_code_pattern_anchors_every_alternative(monkeypatch):
+    module = load_etl(monkeypatch, r'J45\.\d|flu')
+
+    for disease in ['J45.9', 'flu']:
+        module.validate_patient_df(patient_df(disease))
+
+    for disease in ['J45.9x', 'xflu']:
+        with pytest.raises(ValueError, match='disease'):
+            module.validate_patient_df(patient_df(disease))
+
+def test_invalid_disease_code_pattern_fails_at_import(monkeypatch):
+    # Lookahead is valid Python re syntax but unsupported by RE2
+    with pytest.raises(pa.ArrowInvalid):
+        load_etl(monkeypatch, r'flu(?=x)')
+
+def test_transform_upload_assigns_stable_ids():
+    csv = (b'patient_id,age,disease,timestamp\n'
+           b'p1,40,flu,2024-01-01T00:00:00\n'
+           b'p1,40,flu,2024-01-01T00:00:00\n'
+           b'p2,50,flu,2024-01-02T00:00:00\n')
+    with mock.patch('etl.score_features', lambda features: features[:, 0] / 100):
+        records = etl.transform_upload(csv, 'abc')
+        retried = etl.transform_upload(csv, 'abc')
+
+    assert [record['id'] for record in records] == ['abc-0', 'abc-1']
+    assert records == retried
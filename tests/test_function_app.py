@@ -0,0 +1,74 @@
+import json
+from unittest import mock
+import azure.functions as func
+import pytest
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+import function_app
+
+CSV = b'patient_id,age,disease,timestamp\np1,40,flu,2024-01-01T00:00:00\np2,50,flu,2024-01-02T00:00:00\n'
+
+def user_function(name):
+    # The trigger decorators wrap each function; fetch the one the runtime would call
+    return next(f for f in function_app.app.get_functions() if f.get_function_name() == name).get_user_function()
+
+def upload_blob(data=CSV):
+    return func.blob.InputStream(data=data, name='uploads/ab/cd/abcd.csv')
+
+def poison_message(container_name):
+    # Shape of the message the runtime writes to webjobs-blobtrigger-poison
+    body = {'Type': 'BlobTrigger', 'ContainerName': container_name, 'BlobName': 'ab/cd/abcd.csv'}
+    return func.QueueMessage(body=json.dumps(body).encode())
+
+def recorded_statuses(status_container):
+    return [call.args[0]['status'] for call in status_container.upsert_item.call_args_list]
+
+@pytest.fixture
+def status_container():
+    with mock.patch('function_app.status_container') as status_container:
+        status_container.read_item.side_effect = lambda item, partition_key: {'id': item, 'status': 'pending'}
+        yield status_container
+
+def test_etl_completes_with_record_ids(status_container):
+    with mock.patch('etl.score_features', lambda features: features[:, 0] / 100), \
+            mock.patch('function_app.bulk_upsert', new_callable=mock.AsyncMock) as bulk_upsert:
+        user_function('etl')(upload_blob())
+
+    rows = bulk_upsert.call_args.args[0]
+    assert [row['id'] for row in rows] == ['abcd-0', 'abcd-1']
+    assert recorded_statuses(status_container) == ['processing', 'completed']
+    assert status_container.upsert_item.call_args.args[0]['stored'] == 2
+
+def test_etl_marks_invalid_upload_failed(status_container):
+    with mock.patch('function_app.bulk_upsert', new_callable=mock.AsyncMock) as bulk_upsert:
+        # Returns instead of raising, so the runtime doesn't retry bad data
+        user_function('etl')(upload_blob(b'patient_id,age\np1,40\n'))
+
+    bulk_upsert.assert_not_called()
+    assert recorded_statuses(status_container) == ['processing', 'failed']
+
+def test_etl_retries_transient_errors(status_container):
+    with mock.patch('function_app.transform_upload', return_value=[{'id': 'abcd-0'}]), \
+            mock.patch('function_app.bulk_upsert', side_effect=ConnectionError('timed out')):
+        with pytest.raises(ConnectionError):
+            user_function('etl')(upload_blob())
+
+    assert recorded_statuses(status_container) == ['processing', 'retrying']
+
+def test_etl_skips_blob_without_status_document(status_container):
+    status_container.read_item.side_effect = CosmosResourceNotFoundError()
+    with mock.patch('function_app.transform_upload') as transform_upload:
+        user_function('etl')(upload_blob())
+
+    transform_upload.assert_not_called()
+    status_container.upsert_item.assert_not_called()
+
+def test_etl_poison_marks_upload_failed(status_container):
+    user_function('etl_poison')(poison_message(function_app.settings.UPLOAD_BLOB_CONTAINER))
+
+    assert recorded_statuses(status_container) == ['failed']
+    assert status_container.upsert_item.call_args.args[0]['id'] == 'abcd'
+
+def test_etl_poison_ignores_other_containers(status_container):
+    user_function('etl_poison')(poison_message('other'))
+
+    status_container.upsert_item.assert_not_called()